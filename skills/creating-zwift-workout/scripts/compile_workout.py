@@ -1,20 +1,32 @@
 #!/usr/bin/env -S uv run --script
 # /// script
 # requires-python = ">=3.11"
-# dependencies = ["pyyaml"]
+# dependencies = ["lxml", "pyyaml"]
 # ///
 """Compile a YAML/JSON workout plan into a Zwift .zwo file."""
 from __future__ import annotations
 
 import argparse
+import functools
+import io
 import json
+import re
 import sys
 from pathlib import Path
 from typing import Any
-import xml.etree.ElementTree as ET
 
 import yaml
 
+try:
+    import lxml.etree as ET
+except ImportError:  # lxml not available
+    import xml.etree.ElementTree as ET
+
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:  # libyaml not available
+    from yaml import SafeLoader as _YamlLoader
+
 from validate_zwo import load_schema, validate_file
 
 ZONE_POWER = {
@@ -26,32 +38,63 @@ ZONE_POWER = {
     "z6": 1.20,
 }
 
+# Expansion of the `standard_warmup` block as (tag, attributes) pairs.
+STANDARD_WARMUP: tuple[tuple[str, tuple[tuple[str, str], ...]], ...] = (
+    ("Warmup", (("Duration", "600"), ("PowerLow", "0.5"), ("PowerHigh", "0.77"))),
+    ("FreeRide", (("Duration", "60"), ("FlatRoad", "1"), ("Cadence", "110"))),
+    ("SteadyState", (("Duration", "60"), ("Power", "0.5"))),
+    ("FreeRide", (("Duration", "60"), ("FlatRoad", "1"), ("Cadence", "110"))),
+    ("SteadyState", (("Duration", "60"), ("Power", "0.5"))),
+)
+
+_UNSAFE_FILENAME_RE = re.compile(r"[^A-Za-z0-9_-]+")
+_UNDERSCORES_RE = re.compile(r"_+")
+# Characters that may need escaping in XML text or attribute values.
+_ESCAPE_RE = re.compile(r'[&<>"\n\r\t]')
+# Anything outside the XML 1.0 Char production (control characters,
+# surrogates, U+FFFE/U+FFFF) cannot appear in a .zwo file at all.
+_INVALID_XML_RE = re.compile("[^\t\n\r\x20-\ud7ff\ue000-\ufffd\U00010000-\U0010ffff]")
+
+# Power ratios are always written with four decimals.
+_fmt4 = "{:.4f}".format
+
 
 class PlanError(ValueError):
     pass
 
 
 def load_plan(path: Path) -> dict[str, Any]:
-    text = path.read_text()
     if path.suffix.lower() in {".json"}:
-        return json.loads(text)
-    return yaml.safe_load(text)
+        return json.loads(path.read_text())
+    with path.open("rb") as fh:
+        return yaml.load(fh, Loader=_YamlLoader)
 
 
 def slugify(name: str) -> str:
-    import re
-
-    safe = re.sub(r"[^A-Za-z0-9_-]+", "_", name.strip())
-    safe = re.sub(r"_+", "_", safe).strip("_")
+    safe = _UNSAFE_FILENAME_RE.sub("_", name.strip())
+    safe = _UNDERSCORES_RE.sub("_", safe).strip("_")
     return safe or "workout"
 
 
+def xml_str(value: Any, field: str) -> str:
+    text = str(value)
+    if _INVALID_XML_RE.search(text):
+        raise PlanError(f"{field} contains characters not allowed in XML: {text!r}")
+    return text
+
+
 def to_seconds(minutes: float | int | None) -> int:
     if minutes is None:
         return 0
     return int(round(float(minutes) * 60))
 
 
+@functools.lru_cache(maxsize=256)
+def zone_ratio(value: str) -> float | None:
+    # Plans repeat the same few zone strings, so normalize each one only once.
+    return ZONE_POWER.get(value.lower().strip())
+
+
 def power_to_ratio(value: Any, ftp: float | None, field: str) -> tuple[float | None, float | None, bool]:
     if value is None:
         return None, None, False
@@ -62,9 +105,9 @@ def power_to_ratio(value: Any, ftp: float | None, field: str) -> tuple[float | N
         return low, high, True
 
     if isinstance(value, str):
-        key = value.lower().strip()
-        if key in ZONE_POWER:
-            return ZONE_POWER[key], None, False
+        ratio = zone_ratio(value)
+        if ratio is not None:
+            return ratio, None, False
         raise PlanError(f"Unsupported power string for {field}: {value}")
 
     if isinstance(value, dict):
@@ -85,35 +128,63 @@ def require_power(value: float | None, field: str) -> float:
     return float(value)
 
 
-def standard_warmup() -> list[dict[str, Any]]:
-    return [
-        {"tag": "Warmup", "Duration": 600, "PowerLow": 0.5, "PowerHigh": 0.77},
-        {"tag": "FreeRide", "Duration": 60, "FlatRoad": 1, "Cadence": 110},
-        {"tag": "SteadyState", "Duration": 60, "Power": 0.5},
-        {"tag": "FreeRide", "Duration": 60, "FlatRoad": 1, "Cadence": 110},
-        {"tag": "SteadyState", "Duration": 60, "Power": 0.5},
-    ]
+def _sub(parent: ET.Element, tag: str, attrs: dict[str, str] | None = None) -> ET.Element:
+    # Always create children in place; never build detached elements to append.
+    return ET.SubElement(parent, tag, attrs or {})
 
 
-def emit_block(workout_el: ET.Element, block: dict[str, Any], ftp: float | None) -> None:
+def _tree_bytes(tree: ET.ElementTree) -> bytes:
+    buf = io.BytesIO()
+    tree.write(buf, encoding="utf-8", xml_declaration=True)
+    return buf.getvalue()
+
+
+def _probe(text: str | None = None, **attrs: str) -> str:
+    elem = ET.Element("p", attrs)
+    elem.text = text
+    return ET.tostring(elem, encoding="unicode")
+
+
+# render_plan reproduces the serialization details of whichever ET backend is
+# in use (lxml and ElementTree differ), so both emit modes write the same bytes.
+XML_DECLARATION = _tree_bytes(ET.ElementTree(ET.Element("p"))).partition(b"<p")[0]
+_EMPTY_CLOSE = _probe()[len("<p") :]
+_EMPTY_TEXT_SELF_CLOSES = _probe("") == _probe()
+
+
+def _xml_attr(value: str) -> str:
+    if not _ESCAPE_RE.search(value):
+        return f'"{value}"'
+    # Rare: let the backend pick the escaping, then cut the quoted value out.
+    return _probe(v=value)[len("<p v=") : -len(_EMPTY_CLOSE)]
+
+
+def _xml_text(tag: str, value: str) -> str:
+    if not value:
+        return f"<{tag}{_EMPTY_CLOSE}" if _EMPTY_TEXT_SELF_CLOSES else f"<{tag}></{tag}>"
+    if _ESCAPE_RE.search(value):
+        value = _probe(value)[len("<p>") : -len("</p>")]
+    return f"<{tag}>{value}</{tag}>"
+
+
+# Resolve a plan block to the (tag, attributes) pairs of the .zwo elements it
+# produces; emit_block and render_plan serialize the same pairs.
+def resolve_block(block: dict[str, Any], ftp: float | None) -> list[tuple[str, dict[str, str]]]:
     block_type = block.get("type")
     if not block_type:
         raise PlanError("Block missing type")
 
     if block_type == "standard_warmup":
-        for b in standard_warmup():
-            tag = b.pop("tag")
-            ET.SubElement(workout_el, tag, {k: str(v) for k, v in b.items()})
-        return
+        return [(tag, dict(attrs)) for tag, attrs in STANDARD_WARMUP]
 
     if block_type == "repeat":
         times = int(block.get("times", 0))
         if times <= 0:
             raise PlanError("repeat.times must be > 0")
-        for _ in range(times):
-            for child in block.get("blocks", []):
-                emit_block(workout_el, child, ftp)
-        return
+        # Every pass is identical, so resolve the child blocks once and repeat
+        # the resulting (tag, attrs) pairs.
+        body = [el for child in block.get("blocks", []) for el in resolve_block(child, ftp)]
+        return body * times
 
     if block_type in {"warmup", "cooldown", "ramp"}:
         tag = block_type.capitalize()
@@ -130,13 +201,12 @@ def emit_block(workout_el: ET.Element, block: dict[str, Any], ftp: float | None)
 
         attrs: dict[str, str] = {
             "Duration": str(duration),
-            "PowerLow": f"{require_power(power_low, 'power_low'):.4f}",
-            "PowerHigh": f"{require_power(power_high, 'power_high'):.4f}",
+            "PowerLow": _fmt4(require_power(power_low, "power_low")),
+            "PowerHigh": _fmt4(require_power(power_high, "power_high")),
         }
         if "cadence" in block:
             attrs["Cadence"] = str(int(block["cadence"]))
-        ET.SubElement(workout_el, tag, attrs)
-        return
+        return [(tag, attrs)]
 
     if block_type in {"steadystate", "steady"}:
         duration = to_seconds(block.get("minutes")) or int(block.get("seconds", 0))
@@ -145,11 +215,10 @@ def emit_block(workout_el: ET.Element, block: dict[str, Any], ftp: float | None)
         power, _, _ = power_to_ratio(block.get("power"), ftp, "power")
         if power is None:
             raise PlanError("steady requires power")
-        attrs = {"Duration": str(duration), "Power": f"{float(power):.4f}"}
+        attrs = {"Duration": str(duration), "Power": _fmt4(float(power))}
         if "cadence" in block:
             attrs["Cadence"] = str(int(block["cadence"]))
-        ET.SubElement(workout_el, "SteadyState", attrs)
-        return
+        return [("SteadyState", attrs)]
 
     if block_type == "freeride":
         duration = to_seconds(block.get("minutes")) or int(block.get("seconds", 0))
@@ -160,8 +229,7 @@ def emit_block(workout_el: ET.Element, block: dict[str, Any], ftp: float | None)
             attrs["FlatRoad"] = str(int(block["flat_road"]))
         if "cadence" in block:
             attrs["Cadence"] = str(int(block["cadence"]))
-        ET.SubElement(workout_el, "FreeRide", attrs)
-        return
+        return [("FreeRide", attrs)]
 
     if block_type == "intervals":
         repeat = int(block.get("repeat", 0))
@@ -185,79 +253,122 @@ def emit_block(workout_el: ET.Element, block: dict[str, Any], ftp: float | None)
         }
 
         if on_is_range:
-            attrs["PowerOnLow"] = f"{require_power(on_low, 'on_power_low'):.4f}"
-            attrs["PowerOnHigh"] = f"{require_power(on_high, 'on_power_high'):.4f}"
+            attrs["PowerOnLow"] = _fmt4(require_power(on_low, "on_power_low"))
+            attrs["PowerOnHigh"] = _fmt4(require_power(on_high, "on_power_high"))
         elif on_low is not None:
-            attrs["OnPower"] = f"{float(on_low):.4f}"
+            attrs["OnPower"] = _fmt4(float(on_low))
 
         if off_is_range:
-            attrs["PowerOffLow"] = f"{require_power(off_low, 'off_power_low'):.4f}"
-            attrs["PowerOffHigh"] = f"{require_power(off_high, 'off_power_high'):.4f}"
+            attrs["PowerOffLow"] = _fmt4(require_power(off_low, "off_power_low"))
+            attrs["PowerOffHigh"] = _fmt4(require_power(off_high, "off_power_high"))
         elif off_low is not None:
-            attrs["OffPower"] = f"{float(off_low):.4f}"
+            attrs["OffPower"] = _fmt4(float(off_low))
 
         if "cadence" in block:
             attrs["Cadence"] = str(int(block["cadence"]))
         if "cadence_rest" in block:
             attrs["CadenceResting"] = str(int(block["cadence_rest"]))
 
-        ET.SubElement(workout_el, "IntervalsT", attrs)
-        return
+        return [("IntervalsT", attrs)]
 
     if block_type == "maxeffort":
         duration = to_seconds(block.get("minutes")) or int(block.get("seconds", 0))
         if duration <= 0:
             raise PlanError("maxeffort requires minutes or seconds")
-        ET.SubElement(workout_el, "MaxEffort", {"Duration": str(duration)})
-        return
+        return [("MaxEffort", {"Duration": str(duration)})]
 
     if block_type == "textevent":
         time_offset = int(block.get("time_offset", 0))
         message = block.get("message")
         if not message:
             raise PlanError("textevent requires message")
-        ET.SubElement(
-            workout_el,
-            "textevent",
-            {"timeoffset": str(time_offset), "message": str(message)},
-        )
-        return
+        return [
+            ("textevent", {"timeoffset": str(time_offset), "message": xml_str(message, "textevent.message")})
+        ]
 
     raise PlanError(f"Unsupported block type: {block_type}")
 
 
-def compile_plan(plan: dict[str, Any]) -> ET.ElementTree:
+def emit_block(workout_el: ET.Element, block: dict[str, Any], ftp: float | None) -> None:
+    for tag, attrs in resolve_block(block, ftp):
+        _sub(workout_el, tag, attrs)
+
+
+def _plan_header(plan: dict[str, Any]) -> list[tuple[str, str]]:
     name = plan.get("name")
     if not name:
         raise PlanError("plan.name is required")
 
-    author = plan.get("author", "creating-zwift-workout")
-    description = plan.get("description", "")
-    sport = plan.get("sport", "bike")
+    return [
+        ("author", xml_str(plan.get("author", "creating-zwift-workout"), "plan.author")),
+        ("name", xml_str(name, "plan.name")),
+        ("description", xml_str(plan.get("description", ""), "plan.description")),
+        ("sportType", xml_str(plan.get("sport", "bike"), "plan.sport")),
+    ]
+
+
+def _plan_tags(plan: dict[str, Any]) -> list[str]:
+    return [xml_str(tag, "plan.tags") for tag in plan.get("tags", ["CUSTOM"])]
+
+
+def compile_plan(plan: dict[str, Any]) -> ET.ElementTree:
+    header = _plan_header(plan)
+    tag_names = _plan_tags(plan)
     ftp = plan.get("ftp")
 
     workout = ET.Element("workout_file")
-    ET.SubElement(workout, "author").text = str(author)
-    ET.SubElement(workout, "name").text = str(name)
-    ET.SubElement(workout, "description").text = str(description)
-    ET.SubElement(workout, "sportType").text = str(sport)
+    for tag, text in header:
+        _sub(workout, tag).text = text
 
-    tags = ET.SubElement(workout, "tags")
-    for tag in plan.get("tags", ["CUSTOM"]):
-        ET.SubElement(tags, "tag", {"name": str(tag)})
+    tags = _sub(workout, "tags")
+    for tag in tag_names:
+        _sub(tags, "tag", {"name": tag})
 
-    workout_el = ET.SubElement(workout, "workout")
+    workout_el = _sub(workout, "workout")
     for block in plan.get("blocks", []):
         emit_block(workout_el, block, ftp)
 
     return ET.ElementTree(workout)
 
 
+def render_plan(plan: dict[str, Any]) -> str:
+    # Plans only produce flat, attribute-only workout elements, so the XML can
+    # be written as text without building an element tree first.
+    header = _plan_header(plan)
+    tag_names = _plan_tags(plan)
+    ftp = plan.get("ftp")
+
+    parts = ["<workout_file>"]
+    for tag, text in header:
+        parts.append(_xml_text(tag, text))
+
+    parts.append("<tags>")
+    for tag in tag_names:
+        parts.append(f"<tag name={_xml_attr(tag)}{_EMPTY_CLOSE}")
+    parts.append("</tags><workout>")
+
+    for block in plan.get("blocks", []):
+        for tag, attrs in resolve_block(block, ftp):
+            parts.append(f"<{tag}")
+            for key, value in attrs.items():
+                parts.append(f" {key}={_xml_attr(value)}")
+            parts.append(_EMPTY_CLOSE)
+
+    parts.append("</workout></workout_file>")
+    return "".join(parts)
+
+
 def main() -> int:
     parser = argparse.ArgumentParser(description="Compile a workout plan to .zwo")
     parser.add_argument("--plan", required=True, help="Path to YAML/JSON plan")
     parser.add_argument("--output", default="workouts", help="Output directory")
     parser.add_argument("--validate", action="store_true", help="Validate .zwo output")
+    parser.add_argument(
+        "--emit",
+        choices=("tree", "string"),
+        default="tree",
+        help="Serialize via an element tree, or write the XML text directly",
+    )
 
     args = parser.parse_args()
     plan_path = Path(args.plan)
@@ -268,15 +379,19 @@ def main() -> int:
         return 2
 
     plan = load_plan(plan_path)
-    tree = compile_plan(plan)
+    if args.emit == "string":
+        xml_text = render_plan(plan)
+    else:
+        tree = compile_plan(plan)
 
     output_dir.mkdir(parents=True, exist_ok=True)
     slug = slugify(str(plan.get("name")))
     output_path = output_dir / f"{slug}.zwo"
-    root = tree.getroot()
-    if root is None:
-        raise PlanError("failed to build workout XML")
-    output_path.write_text(ET.tostring(root, encoding="unicode"))
+    if args.emit == "string":
+        output_path.write_bytes(XML_DECLARATION + xml_text.encode("utf-8"))
+    else:
+        # Serialize straight to UTF-8 bytes on disk rather than via a str.
+        tree.write(str(output_path), encoding="utf-8", xml_declaration=True)
 
     if args.validate:
         tag_attr_usage = Path("sub/zwift-workout-file-reference/tag_attr_usage.json")
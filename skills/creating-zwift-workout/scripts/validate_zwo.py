@@ -1,22 +1,106 @@
 #!/usr/bin/env -S uv run --script
 # /// script
 # requires-python = ">=3.11"
-# dependencies = ["pyyaml"]
+# dependencies = ["lxml", "pyyaml"]
 # ///
 """Strict validator for Zwift .zwo files using the subtree reference."""
 from __future__ import annotations
 
 import argparse
+import functools
+import hashlib
 import json
+import os
+import pickle
 import sys
 from pathlib import Path
-from typing import Iterable
-import xml.etree.ElementTree as ET
+from typing import Any, Iterable
 
 import yaml
 
+try:
+    import lxml.etree as ET
 
-def load_schema(tag_attr_usage_path: Path, descriptions_path: Path) -> tuple[set[str], set[str], dict[str, set[str]]]:
+    XMLParseError = ET.XMLSyntaxError
+except ImportError:  # lxml not available
+    import xml.etree.ElementTree as ET
+
+    XMLParseError = ET.ParseError
+
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:  # libyaml not available
+    from yaml import SafeLoader as _YamlLoader
+
+Schema = tuple[frozenset[str], frozenset[str], dict[str, frozenset[str]]]
+
+# Bump when the shape of Schema changes so stale pickles are ignored.
+SCHEMA_CACHE_VERSION = 1
+# Files handed to a worker per round trip when validating in parallel.
+VALIDATE_CHUNKSIZE = 32
+
+
+def _schema_cache_dir() -> Path | None:
+    cache_home = os.environ.get("XDG_CACHE_HOME")
+    if not cache_home:
+        try:
+            cache_home = Path.home() / ".cache"
+        except RuntimeError:
+            return None  # no HOME and no passwd entry: run without a cache
+    return Path(cache_home) / "zwift-training"
+
+
+def _schema_cache_path(*paths: Path) -> Path | None:
+    cache_dir = _schema_cache_dir()
+    if cache_dir is None:
+        return None
+    # Name entries "schema-<sources>-<state>.pkl": <sources> identifies which
+    # reference files were parsed, <state> their mtime/size at the time.
+    sources = hashlib.sha1()
+    state = hashlib.sha1(str(SCHEMA_CACHE_VERSION).encode())
+    for path in paths:
+        st = path.stat()
+        sources.update(f"\0{path.resolve()}".encode())
+        state.update(f"\0{st.st_mtime_ns}\0{st.st_size}".encode())
+    return cache_dir / f"schema-{sources.hexdigest()[:16]}-{state.hexdigest()[:16]}.pkl"
+
+
+def _write_schema_cache(cache_path: Path, schema: Schema) -> None:
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_bytes(pickle.dumps(schema, protocol=pickle.HIGHEST_PROTOCOL))
+        tmp_path.replace(cache_path)
+        # An edit to either reference file yields a new <state>; drop the
+        # superseded entries for the same sources, leaving other checkouts and
+        # --tag-attr-usage/--descriptions overrides alone.
+        sources_prefix = cache_path.name.rsplit("-", 1)[0]
+        for stale in cache_path.parent.glob(f"{sources_prefix}-*.pkl"):
+            if stale != cache_path:
+                stale.unlink(missing_ok=True)
+    except OSError:
+        pass  # caching is best-effort; a read-only home is fine
+
+
+@functools.lru_cache(maxsize=None)
+def load_schema(tag_attr_usage_path: Path, descriptions_path: Path) -> Schema:
+    cache_path = _schema_cache_path(tag_attr_usage_path, descriptions_path)
+    if cache_path is not None:
+        try:
+            with cache_path.open("rb") as fh:
+                cached = pickle.load(fh)
+            if isinstance(cached, tuple) and len(cached) == 3:
+                return cached
+        except Exception:
+            pass  # missing or unreadable cache entry; parse the sources instead
+
+    schema = _parse_schema(tag_attr_usage_path, descriptions_path)
+    if cache_path is not None:
+        _write_schema_cache(cache_path, schema)
+    return schema
+
+
+def _parse_schema(tag_attr_usage_path: Path, descriptions_path: Path) -> Schema:
     usage = json.loads(tag_attr_usage_path.read_text())
     elements = usage.get("elements", [])
     attributes = usage.get("attributes", [])
@@ -24,67 +108,124 @@ def load_schema(tag_attr_usage_path: Path, descriptions_path: Path) -> tuple[set
     allowed_tags = {e["tag"] for e in elements if "tag" in e}
     allowed_attrs_global = {a["attribute"] for a in attributes if "attribute" in a}
 
-    allowed_attrs_by_tag: dict[str, set[str]] = {}
+    attrs_by_tag: dict[str, set[str]] = {}
     for e in elements:
         tag = e.get("tag")
         attrs = e.get("attributes") or []
         if tag:
-            allowed_attrs_by_tag[tag] = set(attrs)
+            attrs_by_tag[tag] = set(attrs)
 
-    desc = yaml.safe_load(descriptions_path.read_text()) or {}
+    with descriptions_path.open("rb") as fh:
+        desc = yaml.load(fh, Loader=_YamlLoader) or {}
     allowed_tags |= set((desc.get("elements") or {}).keys())
     allowed_attrs_global |= set((desc.get("attributes") or {}).keys())
 
-    return allowed_tags, allowed_attrs_global, allowed_attrs_by_tag
+    # Per-tag lists only matter for attributes that are globally allowed, and
+    # an empty list means "no per-tag restriction", so keep just the non-empty
+    # ones, intersected with the global set. validate_file can then accept most
+    # attributes with a single membership test.
+    allowed_attrs_by_tag = {
+        tag: frozenset(attrs & allowed_attrs_global)
+        for tag, attrs in attrs_by_tag.items()
+        if attrs
+    }
+    return frozenset(allowed_tags), frozenset(allowed_attrs_global), allowed_attrs_by_tag
 
 
 def iter_zwo_files(path: Path) -> Iterable[Path]:
     if path.is_file():
         yield path
         return
-    for item in sorted(path.rglob("*.zwo")):
-        if item.is_file():
-            yield item
+    # Walk with scandir so directory entries' cached type info avoids a stat()
+    # per file; order is unspecified, callers sort if they need to.
+    stack = [str(path)]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:
+            continue  # missing or unreadable, as rglob would skip it
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith(".zwo") and entry.is_file():
+                    yield Path(entry.path)
 
 
 def validate_file(
     path: Path,
-    allowed_tags: set[str],
-    allowed_attrs_global: set[str],
-    allowed_attrs_by_tag: dict[str, set[str]],
+    allowed_tags: frozenset[str],
+    allowed_attrs_global: frozenset[str],
+    allowed_attrs_by_tag: dict[str, frozenset[str]],
     warn_on_mismatch: bool = False,
 ) -> tuple[list[str], list[str]]:
+    root_errors: list[str] = []
     errors: list[str] = []
     warnings: list[str] = []
+    open_elems: list[Any] = []
+    has_workout = False
+    attrs_for_tag = allowed_attrs_by_tag.get
     try:
-        tree = ET.parse(path)
-    except ET.ParseError as exc:
-        return [f"{path}: XML parse error: {exc}"], warnings
-
-    root = tree.getroot()
-    if root.tag != "workout_file":
-        errors.append(f"{path}: root tag is '{root.tag}', expected 'workout_file'")
-
-    if root.find("workout") is None:
-        errors.append(f"{path}: missing <workout> element")
-
-    for elem in root.iter():
-        if elem.tag not in allowed_tags:
-            errors.append(f"{path}: unknown element <{elem.tag}>")
-            continue
-
-        allowed_attrs = allowed_attrs_by_tag.get(elem.tag)
-        for attr in elem.attrib.keys():
-            if attr not in allowed_attrs_global:
-                errors.append(f"{path}: unknown attribute '{attr}' on <{elem.tag}>")
+        # Check tag/attrs on "start" (available before children are parsed) so
+        # messages keep document order. On "end", detach the finished element
+        # from its parent, so memory is bounded by nesting depth rather than
+        # file size.
+        for event, elem in ET.iterparse(str(path), events=("start", "end")):
+            if event == "end":
+                open_elems.pop()
+                if open_elems:
+                    open_elems[-1].remove(elem)
                 continue
-            if allowed_attrs is not None and len(allowed_attrs) > 0:
-                if attr not in allowed_attrs and warn_on_mismatch:
+
+            # lxml builds a new str on every .tag access, so read it once.
+            tag = elem.tag
+            if not open_elems:
+                if tag != "workout_file":
+                    root_errors.append(f"{path}: root tag is '{tag}', expected 'workout_file'")
+            elif len(open_elems) == 1 and tag == "workout":
+                has_workout = True
+            open_elems.append(elem)
+
+            if tag not in allowed_tags:
+                errors.append(f"{path}: unknown element <{tag}>")
+                continue
+
+            # Nearly every element passes; issuperset runs that check in C and
+            # the per-attribute loop only runs to report a problem.
+            allowed_attrs = attrs_for_tag(tag, allowed_attrs_global)
+            attr_names = elem.keys()
+            if allowed_attrs.issuperset(attr_names):
+                continue
+            for attr in attr_names:
+                if attr in allowed_attrs:
+                    continue
+                if attr not in allowed_attrs_global:
+                    errors.append(f"{path}: unknown attribute '{attr}' on <{tag}>")
+                elif warn_on_mismatch:
                     warnings.append(
-                        f"{path}: attribute '{attr}' not listed for <{elem.tag}> in tag_attr_usage.json"
+                        f"{path}: attribute '{attr}' not listed for <{tag}> in tag_attr_usage.json"
                     )
+    except XMLParseError as exc:
+        return [f"{path}: XML parse error: {exc}"], []
+
+    if not has_workout:
+        root_errors.append(f"{path}: missing <workout> element")
+
+    return root_errors + errors, warnings
+
 
-    return errors, warnings
+_worker_schema: Schema | None = None
+
+
+def _init_worker(tag_attr_usage_path: Path, descriptions_path: Path) -> None:
+    # Load the schema once per worker instead of pickling it with every task.
+    global _worker_schema
+    _worker_schema = load_schema(tag_attr_usage_path, descriptions_path)
+
+
+def _validate_in_worker(path: Path, warn_on_mismatch: bool) -> tuple[list[str], list[str]]:
+    assert _worker_schema is not None
+    return validate_file(path, *_worker_schema, warn_on_mismatch=warn_on_mismatch)
 
 
 def main() -> int:
@@ -105,6 +246,12 @@ def main() -> int:
         action="store_true",
         help="Warn when attributes are not listed for a tag in tag_attr_usage.json",
     )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Worker processes for validating thousands of files (default: 1, in process)",
+    )
 
     args = parser.parse_args()
     base = Path(args.path)
@@ -122,21 +269,45 @@ def main() -> int:
         tag_attr_usage, descriptions
     )
 
-    files = list(iter_zwo_files(base))
+    files = sorted(iter_zwo_files(base))
     if not files:
         print("error: no .zwo files found", file=sys.stderr)
         return 2
 
+    if args.jobs > 1 and len(files) > VALIDATE_CHUNKSIZE:
+        # Imported here: the pool module alone roughly doubles import time,
+        # and compile_workout imports this module too.
+        import math
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(
+            # One worker per chunk at most; extra forked workers would sit idle.
+            max_workers=min(args.jobs, math.ceil(len(files) / VALIDATE_CHUNKSIZE)),
+            initializer=_init_worker,
+            initargs=(tag_attr_usage, descriptions),
+        ) as executor:
+            results = list(
+                executor.map(
+                    functools.partial(_validate_in_worker, warn_on_mismatch=args.warn_mismatch),
+                    files,
+                    chunksize=VALIDATE_CHUNKSIZE,
+                )
+            )
+    else:
+        results = [
+            validate_file(
+                file_path,
+                allowed_tags,
+                allowed_attrs_global,
+                allowed_attrs_by_tag,
+                warn_on_mismatch=args.warn_mismatch,
+            )
+            for file_path in files
+        ]
+
     all_errors: list[str] = []
     all_warnings: list[str] = []
-    for file_path in files:
-        errors, warnings = validate_file(
-            file_path,
-            allowed_tags,
-            allowed_attrs_global,
-            allowed_attrs_by_tag,
-            warn_on_mismatch=args.warn_mismatch,
-        )
+    for errors, warnings in results:
         all_errors.extend(errors)
         all_warnings.extend(warnings)
 
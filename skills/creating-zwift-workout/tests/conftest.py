@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The scripts are standalone uv scripts rather than a package.
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
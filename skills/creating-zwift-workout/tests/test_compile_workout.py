@@ -0,0 +1,94 @@
+from pathlib import Path
+from xml.etree.ElementTree import canonicalize
+
+import pytest
+
+from compile_workout import (
+    XML_DECLARATION,
+    PlanError,
+    _tree_bytes,
+    compile_plan,
+    load_plan,
+    render_plan,
+)
+
+REPO_ROOT = Path(__file__).resolve().parents[3]
+DATA_DIR = Path(__file__).resolve().parent / "data"
+
+ESCAPING_PLAN = {
+    "name": 'Repeat & <test> "q"',
+    "author": "A & B",
+    "description": "",
+    "ftp": 250,
+    "tags": ["CUSTOM", 'X&Y"\t'],
+    "blocks": [
+        {"type": "standard_warmup"},
+        {
+            "type": "repeat",
+            "times": 3,
+            "blocks": [
+                {
+                    "type": "intervals",
+                    "repeat": 4,
+                    "on_seconds": 30,
+                    "on_power": {"pct": 120},
+                    "off_seconds": 30,
+                    "off_power": {"watts": 125},
+                    "cadence": 100,
+                },
+                {
+                    "type": "repeat",
+                    "times": 2,
+                    "blocks": [{"type": "steady", "seconds": 45, "power": "Z3"}],
+                },
+            ],
+        },
+        {"type": "textevent", "time_offset": 60, "message": 'Go "hard" & <fast>\n\tnow\r'},
+        {"type": "cooldown", "minutes": 5, "power": [0.6, 0.4]},
+    ],
+}
+
+
+CONTROL_CHAR_PLANS = {
+    "control-char-description": {**ESCAPING_PLAN, "description": "bell\x01here"},
+    "control-char-message": {
+        **ESCAPING_PLAN,
+        "blocks": [{"type": "textevent", "time_offset": 0, "message": "bell\x07"}],
+    },
+}
+
+
+@pytest.mark.parametrize(
+    ("plan", "expected", "error"),
+    [
+        pytest.param(
+            load_plan(REPO_ROOT / "skills/creating-zwift-workout/references/example-workout.yaml"),
+            REPO_ROOT / "workouts/60min_Z2_3x2_105-110.zwo",
+            None,
+            id="example",
+        ),
+        pytest.param(
+            load_plan(REPO_ROOT / "workout-plans/60min_z2_4x2_110-120pct.yaml"),
+            REPO_ROOT / "workouts/60min_Z2_4x2_110-120pct.zwo",
+            None,
+            id="workout-plan",
+        ),
+        pytest.param(ESCAPING_PLAN, DATA_DIR / "escaping_plan.zwo", None, id="escaping"),
+        *(pytest.param(plan, None, PlanError, id=name) for name, plan in CONTROL_CHAR_PLANS.items()),
+    ],
+)
+def test_emit_modes_match(plan, expected, error):
+    # ``expected`` is what the stdlib-only compiler wrote before the lxml
+    # backend existed; both emit modes must stay equivalent to it.
+    if error is not None:
+        with pytest.raises(error):
+            compile_plan(plan)
+        with pytest.raises(error):
+            render_plan(plan)
+        return
+
+    tree_bytes = _tree_bytes(compile_plan(plan))
+    string_bytes = XML_DECLARATION + render_plan(plan).encode("utf-8")
+
+    assert string_bytes == tree_bytes
+    assert canonicalize(string_bytes.decode("utf-8")) == canonicalize(expected.read_text(encoding="utf-8"))
@@ -0,0 +1,173 @@
+import xml.etree.ElementTree as StdET
+from pathlib import Path
+
+import pytest
+
+import validate_zwo
+from validate_zwo import _parse_schema, iter_zwo_files, validate_file
+
+try:
+    import lxml.etree as LxmlET
+except ImportError:
+    LxmlET = None
+
+REPO_ROOT = Path(__file__).resolve().parents[3]
+SCHEMA_DIR = REPO_ROOT / "sub/zwift-workout-file-reference"
+
+
+@pytest.fixture(params=["lxml", "stdlib"])
+def backend(request, monkeypatch):
+    if request.param == "lxml":
+        if LxmlET is None:
+            pytest.skip("lxml is not installed")
+        monkeypatch.setattr(validate_zwo, "ET", LxmlET)
+        monkeypatch.setattr(validate_zwo, "XMLParseError", LxmlET.XMLSyntaxError)
+    else:
+        monkeypatch.setattr(validate_zwo, "ET", StdET)
+        monkeypatch.setattr(validate_zwo, "XMLParseError", StdET.ParseError)
+    return request.param
+
+
+@pytest.fixture(scope="module")
+def schema():
+    return _parse_schema(SCHEMA_DIR / "tag_attr_usage.json", SCHEMA_DIR / "descriptions.yaml")
+
+
+def _validate(tmp_path, xml, schema, warn_on_mismatch=False):
+    path = tmp_path / "test.zwo"
+    path.write_text(xml, encoding="utf-8")
+    errors, warnings = validate_file(path, *schema, warn_on_mismatch=warn_on_mismatch)
+    prefix = f"{path}: "
+    return [e.removeprefix(prefix) for e in errors], [w.removeprefix(prefix) for w in warnings]
+
+
+@pytest.mark.parametrize(
+    ("xml", "errors"),
+    [
+        pytest.param(
+            '<workout_file><workout><SteadyState Duration="60" Power="0.6"/></workout></workout_file>',
+            [],
+            id="valid",
+        ),
+        pytest.param(
+            "<foo><workout/></foo>",
+            ["root tag is 'foo', expected 'workout_file'", "unknown element <foo>"],
+            id="wrong-root",
+        ),
+        pytest.param(
+            "<foo><bar/></foo>",
+            [
+                "root tag is 'foo', expected 'workout_file'",
+                "missing <workout> element",
+                "unknown element <foo>",
+                "unknown element <bar>",
+            ],
+            id="wrong-root-no-workout",
+        ),
+        pytest.param(
+            "<workout_file><author/><workout/></workout_file>",
+            [],
+            id="workout-not-first-child",
+        ),
+        pytest.param(
+            "<workout_file><tags><workout/></tags></workout_file>",
+            ["missing <workout> element"],
+            id="nested-workout",
+        ),
+        pytest.param(
+            '<?xml version="1.0"?>\n<!-- head --><?pi head?>'
+            "<workout_file><!-- c --><?pi body?><workout><!-- c --></workout></workout_file>"
+            "<!-- tail -->",
+            [],
+            id="comments-and-pis",
+        ),
+        pytest.param(
+            '<workout_file><!-- c --><Bogus x="1"/><SteadyState Duration="1" Foo="2" Power="1"/></workout_file>',
+            [
+                "missing <workout> element",
+                "unknown element <Bogus>",
+                "unknown attribute 'Foo' on <SteadyState>",
+            ],
+            id="unknown-element-and-attribute",
+        ),
+        pytest.param(
+            "<workout_file><workout><Bogus><Inner/></Bogus>"
+            '<SteadyState A="1" Duration="1" B="2"/></workout></workout_file>',
+            [
+                "unknown element <Bogus>",
+                "unknown element <Inner>",
+                "unknown attribute 'A' on <SteadyState>",
+                "unknown attribute 'B' on <SteadyState>",
+            ],
+            id="errors-in-document-order",
+        ),
+    ],
+)
+def test_validate_file_errors(backend, tmp_path, schema, xml, errors):
+    assert _validate(tmp_path, xml, schema) == (errors, [])
+
+
+@pytest.mark.parametrize(
+    ("warn_on_mismatch", "warnings"),
+    [
+        pytest.param(False, [], id="quiet"),
+        pytest.param(
+            True,
+            [
+                "attribute 'Power' not listed for <textevent> in tag_attr_usage.json",
+                "attribute 'Duration' not listed for <textevent> in tag_attr_usage.json",
+            ],
+            id="warn-mismatch",
+        ),
+    ],
+)
+def test_validate_file_mismatch_warnings(backend, tmp_path, schema, warn_on_mismatch, warnings):
+    xml = (
+        '<workout_file><workout><SteadyState Duration="60" Power="0.6">'
+        '<textevent timeoffset="0" message="go" Power="1" Duration="2" Nope="3"/>'
+        "</SteadyState></workout></workout_file>"
+    )
+    errors = ["unknown attribute 'Nope' on <textevent>"]
+    assert _validate(tmp_path, xml, schema, warn_on_mismatch) == (errors, warnings)
+
+
+def test_validate_file_per_tag_list_outside_global_set(backend, tmp_path):
+    # Ramp's per-tag list only names an attribute that is not allowed
+    # globally, so its intersected set is empty: nothing is accepted silently.
+    usage = tmp_path / "tag_attr_usage.json"
+    usage.write_text(
+        '{"elements": [{"tag": "workout_file"}, {"tag": "workout", "attributes": []},'
+        ' {"tag": "Ramp", "attributes": ["Legacy"]}],'
+        ' "attributes": [{"attribute": "Duration"}]}'
+    )
+    descriptions = tmp_path / "descriptions.yaml"
+    descriptions.write_text("{}\n")
+    schema = _parse_schema(usage, descriptions)
+    assert schema[2]["Ramp"] == frozenset()
+
+    xml = '<workout_file><workout><Ramp Duration="1" Legacy="2"/></workout></workout_file>'
+    assert _validate(tmp_path, xml, schema, warn_on_mismatch=True) == (
+        ["unknown attribute 'Legacy' on <Ramp>"],
+        ["attribute 'Duration' not listed for <Ramp> in tag_attr_usage.json"],
+    )
+
+
+def test_validate_file_parse_error(backend, tmp_path, schema):
+    errors, warnings = _validate(tmp_path, "<workout_file><workout>", schema)
+    assert len(errors) == 1
+    assert errors[0].startswith("XML parse error: ")
+    assert warnings == []
+
+
+def test_iter_zwo_files_skips_symlinked_directories(tmp_path):
+    real = tmp_path / "real"
+    real.mkdir()
+    (real / "a.zwo").write_text("")
+    (real / "notes.txt").write_text("")
+    (tmp_path / "b.zwo").write_text("")
+    (tmp_path / "dir.zwo").mkdir()
+    (tmp_path / "link").symlink_to(real, target_is_directory=True)
+
+    assert sorted(iter_zwo_files(tmp_path)) == [tmp_path / "b.zwo", real / "a.zwo"]
+    assert list(iter_zwo_files(real / "a.zwo")) == [real / "a.zwo"]
+    assert list(iter_zwo_files(tmp_path / "missing")) == []